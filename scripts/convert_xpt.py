@@ -4,7 +4,8 @@ scripts/convert_xpt.py
 
 Convert the NHANES CBC_J.xpt (SAS XPORT format) dataset to:
   - data/CBC_J.csv
-  - data/CBC_J.json  (records orientation)
+  - data/CBC_J.json     (records orientation)
+  - data/CBC_J.parquet  (columnar binary, for fast repeat reads)
 
 This data is REFERENCE ONLY in our pipeline.
 We DO NOT embed the rows — only the curated test metadata in seed_neo4j.ts uses Gemini.
@@ -14,7 +15,8 @@ The CSV/JSON is useful for:
   - Optional: enriching the graph with population stats later
 
 SETUP:
-  pip install pandas pyreadstat
+  pip install pandas polars-readstat
+  # OR: pip install pandas pyreadstat
   # OR: pip install pandas  (pandas ≥ 1.0 can read XPT natively)
 
   Download CBC_J.xpt from:
@@ -24,20 +26,71 @@ SETUP:
 RUN:
   python scripts/convert_xpt.py
   # or: python scripts/convert_xpt.py --input data/CBC_J.xpt --out-dir data
+  # or: python scripts/convert_xpt.py --input "data/*.xpt"   (parallel)
 """
 
 import argparse
+import glob
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+try:
+    # Optional: JIT-compiled, parallel per-column quantiles for the
+    # reference-range summary. Falls back to pandas when numba is absent.
+    from numba import njit, prange  # type: ignore
 
-def load_xpt(filepath: str) -> pd.DataFrame:
+    @njit(parallel=True, cache=True)
+    def _col_quantiles(arr, qs):
+        """Per-column quantiles of a (rows, cols) float64 array, NaN-aware."""
+        out = np.full((arr.shape[1], qs.size), np.nan)
+        for j in prange(arr.shape[1]):
+            col = arr[:, j]
+            col = col[~np.isnan(col)]
+            if col.size == 0:
+                continue
+            col.sort()
+            positions = np.linspace(0.0, 1.0, col.size)
+            for k in range(qs.size):
+                out[j, k] = np.interp(qs[k], positions, col)
+        return out
+
+except ImportError:
+    _col_quantiles = None
+
+# NHANES variable names → human-readable names for the key CBC measures.
+# Used for reference-range percentiles and for column projection when only
+# the summary columns are needed.
+NHANES_TO_NAME = {
+    "LBXWBCSI": "WBC (10^3/mcL)",
+    "LBXRBCSI": "RBC (M/mcL)",
+    "LBXHGB":   "Hemoglobin (g/dL)",
+    "LBXHCT":   "Hematocrit (%)",
+    "LBXMCVSI": "MCV (fL)",
+    "LBXMC":    "MCH (pg)",
+    "LBXMCHSI": "MCHC (g/dL)",
+    "LBXRDW":   "RDW (%)",
+    "LBXPLTSI": "Platelets (10^3/mcL)",
+    "LBXMPSI":  "MPV (fL)",
+    "LBXNRBC":  "NRBC (/100 WBC)",
+}
+
+
+def load_xpt(filepath: str, columns: list | None = None) -> pd.DataFrame:
     """
-    Load a SAS XPORT (.xpt) file using pandas.
-    pandas ≥ 1.0 supports read_sas natively.
-    Falls back to pyreadstat if pandas read_sas fails.
+    Load a SAS XPORT (.xpt) file.
+    Prefers the Rust-backed polars-readstat reader (much faster than the
+    pure-Python pandas XPORT parser, and supports column projection so
+    unused columns are never materialized).
+    Falls back to pandas.read_sas, then pyreadstat.
+
+    If `columns` is given, only those columns are loaded (plus whatever the
+    reader needs); the polars path pushes the projection into the parser.
     """
     path = Path(filepath)
     if not path.exists():
@@ -48,9 +101,28 @@ def load_xpt(filepath: str) -> pd.DataFrame:
         )
         sys.exit(1)
 
-    # ── Method 1: pandas native (preferred) ───────────────────────────────────
+    # ── Method 0: polars-readstat (Rust XPORT parser, preferred) ──────────────
+    try:
+        import polars_readstat as prs  # type: ignore
+
+        lf = prs.scan_readstat(str(filepath))
+        if columns:
+            # Projection is pushed into the parser — unused columns are
+            # never decoded.
+            lf = lf.select([c for c in columns if c in lf.collect_schema().names()])
+        df = lf.collect().to_pandas()
+        print(f"✅ Loaded with polars_readstat: {len(df):,} rows × {len(df.columns)} cols")
+        return df
+    except ImportError:
+        pass  # optional dependency — fall through to pandas
+    except Exception as e_prs:
+        print(f"⚠️  polars_readstat failed ({e_prs}), trying pandas…")
+
+    # ── Method 1: pandas native ───────────────────────────────────────────────
     try:
         df = pd.read_sas(filepath, format="xport", encoding="utf-8")
+        if columns:
+            df = df[[c for c in columns if c in df.columns]]
         print(f"✅ Loaded with pandas.read_sas: {len(df):,} rows × {len(df.columns)} cols")
         return df
     except Exception as e_pandas:
@@ -61,6 +133,8 @@ def load_xpt(filepath: str) -> pd.DataFrame:
         import pyreadstat  # type: ignore
 
         df, meta = pyreadstat.read_xpt(filepath)
+        if columns:
+            df = df[[c for c in columns if c in df.columns]]
         print(f"✅ Loaded with pyreadstat: {len(df):,} rows × {len(df.columns)} cols")
         print(f"   Variable labels: {list(meta.column_labels[:5])} …")
         return df
@@ -75,34 +149,203 @@ def load_xpt(filepath: str) -> pd.DataFrame:
         sys.exit(1)
 
 
+def iter_xpt(filepath: str, chunksize: int = 50_000):
+    """
+    Yield DataFrame chunks from an XPT file without materializing the whole
+    frame — keeps peak memory bounded for large NHANES files.
+    """
+    path = Path(filepath)
+    if not path.exists():
+        print(f"ERROR: File not found: {filepath}", file=sys.stderr)
+        print(
+            "Download from: https://wwwn.cdc.gov/nchs/nhanes/2017-2018/CBC_J.XPT",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    with pd.read_sas(filepath, format="xport", encoding="utf-8", chunksize=chunksize) as reader:
+        yield from reader
+
+
+def load_xpt_cached(filepath: str) -> pd.DataFrame:
+    """
+    Load an XPT file, caching the decoded DataFrame as a pickle next to it.
+    XPORT parsing is slow; repeat runs (e.g. --summary tweaks) become a
+    protocol-5 pickle load instead of a re-parse. The cache is keyed by the
+    input file's mtime+size, so editing or re-downloading the XPT
+    invalidates it automatically.
+    """
+    path = Path(filepath)
+    if not path.exists():
+        return load_xpt(filepath)  # reports the download hint and exits
+
+    st = path.stat()
+    cache_key = f"{st.st_mtime_ns}-{st.st_size}"
+    cache_path = path.with_suffix(".cache.pkl")
+
+    if cache_path.exists():
+        try:
+            cached = pd.read_pickle(cache_path)
+            if cached.get("key") == cache_key:
+                df = cached["df"]
+                print(f"✅ Loaded from cache: {len(df):,} rows × {len(df.columns)} cols  ({cache_path.name})")
+                return df
+        except Exception:
+            pass  # corrupt/old cache — fall through and re-parse
+
+    df = load_xpt(filepath)
+    try:
+        pd.to_pickle({"key": cache_key, "df": df}, cache_path, protocol=5)
+    except OSError:
+        pass  # read-only data dir — caching is best-effort
+    return df
+
+
 def print_column_summary(df: pd.DataFrame) -> None:
     """Print column names and non-null counts for inspection."""
     print("\n── Column summary ──────────────────────────────────────────")
-    for col in df.columns:
-        non_null = df[col].notna().sum()
-        dtype = df[col].dtype
-        print(f"  {col:<20} dtype={str(dtype):<10} non_null={non_null:,}")
+    # df.count() gets every column's non-null count in one pass instead of
+    # materializing a boolean mask per column
+    counts = df.count()
+    dtypes = df.dtypes
+    for col, non_null in counts.items():
+        print(f"  {col:<20} dtype={str(dtypes[col]):<10} non_null={non_null:,}")
     print()
 
 
-def save_outputs(df: pd.DataFrame, out_dir: str) -> None:
-    """Save CSV and JSON outputs."""
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Down-cast float64 columns before writing outputs.
+    NHANES lab values carry 3-4 significant digits, so float32 is lossless
+    in practice and halves bytes on disk and in every downstream load.
+    SEQN is an identifier — store it as an integer.
+    """
+    casts = {c: "float32" for c in df.select_dtypes("float64").columns}
+    if "SEQN" in casts and not df["SEQN"].isna().any():
+        casts["SEQN"] = "int32"
+    return df.astype(casts) if casts else df
+
+
+def save_outputs(df: pd.DataFrame, out_dir: str, stem: str = "CBC_J") -> None:
+    """Save CSV, JSON and Parquet outputs named after the input file stem."""
     out_path = Path(out_dir)
     out_path.mkdir(parents=True, exist_ok=True)
 
-    csv_path = out_path / "CBC_J.csv"
-    json_path = out_path / "CBC_J.json"
+    # Round floats to 4 dp once, in float64, shared by the CSV and JSON
+    # writers. Rounding must happen before any float32 downcast: float32
+    # values come back as the nearest Python double when converted to
+    # records (7.4 → 7.400000095…), which would bloat the JSON.
+    df_rounded = df.round(4)
+
+    csv_path = out_path / f"{stem}.csv"
+    json_path = out_path / f"{stem}.json"
+    parquet_path = out_path / f"{stem}.parquet"
 
     # ── CSV ────────────────────────────────────────────────────────────────────
-    df.to_csv(csv_path, index=False, float_format="%.4f")
+    try:
+        # pyarrow's C++ CSV writer encodes columns natively and in parallel,
+        # avoiding pandas' per-cell Python formatting loop.
+        import pyarrow as pa  # type: ignore
+        import pyarrow.csv as pacsv  # type: ignore
+
+        pacsv.write_csv(
+            pa.Table.from_pandas(_downcast(df_rounded), preserve_index=False),
+            csv_path,
+            write_options=pacsv.WriteOptions(include_header=True),
+        )
+    except ImportError:
+        # 64 KB binary buffer: pandas writes bytes straight through instead
+        # of paying TextIOWrapper encode overhead per row
+        with open(csv_path, "wb", buffering=1 << 16) as f:
+            df.to_csv(f, index=False, float_format="%.4f")
     print(f"✅ CSV  saved → {csv_path}  ({csv_path.stat().st_size // 1024:,} KB)")
 
     # ── JSON (records orientation) ─────────────────────────────────────────────
-    # round floats to 4 dp to keep file size manageable
-    df_rounded = df.round(4)
-    df_rounded.to_json(json_path, orient="records", indent=2)
+    try:
+        # orjson's native encoder is far faster than pandas' Python-level
+        # JSON formatter and writes bytes directly.
+        import orjson  # type: ignore
+
+        records = df_rounded.to_dict(orient="records")
+        json_path.write_bytes(
+            orjson.dumps(records, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        )
+    except ImportError:
+        # double_precision trims to 4 dp during serialization — no rounded
+        # copy needed on this path at all
+        with open(json_path, "wb", buffering=1 << 16) as f:
+            df.to_json(f, orient="records", indent=2, double_precision=4)
     print(f"✅ JSON saved → {json_path}  ({json_path.stat().st_size // 1024:,} KB)")
 
+    # ── Parquet (columnar binary sidecar) ──────────────────────────────────────
+    # Downstream scripts (e.g. create_fpdf2_sample.py) can read individual
+    # columns from this without re-parsing any text. The downcast halves
+    # the binary output; values stay unrounded.
+    try:
+        _downcast(df).to_parquet(parquet_path, compression="zstd")
+        print(f"✅ PARQUET saved → {parquet_path}  ({parquet_path.stat().st_size // 1024:,} KB)")
+    except ImportError:
+        print("⚠️  Skipping Parquet output (pyarrow/fastparquet not installed)")
+
+
+def save_outputs_streamed(chunks, out_dir: str, stem: str = "CBC_J") -> pd.DataFrame:
+    """
+    Consume an iterator of DataFrame chunks, appending each to the CSV and
+    Parquet outputs so peak memory stays at one chunk. Requires pyarrow.
+    JSON output is skipped in streaming mode (a records-orientation file
+    cannot be appended to incrementally).
+
+    Returns a frame holding only the reference-range summary columns,
+    accumulated across chunks, for show_reference_ranges.
+    """
+    import pyarrow as pa  # type: ignore
+    import pyarrow.csv as pacsv  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    csv_path = out_path / f"{stem}.csv"
+    parquet_path = out_path / f"{stem}.parquet"
+
+    csv_writer = None
+    pq_writer = None
+    summary_parts = []
+    total_rows = 0
+    try:
+        for chunk in chunks:
+            # float64 → float32 only. _downcast's SEQN int cast depends on
+            # the chunk having no NaNs, so per-chunk decisions could change
+            # the schema mid-stream — and the writers freeze their schema
+            # from the first chunk.
+            casts = {c: "float32" for c in chunk.select_dtypes("float64").columns}
+            if casts:
+                chunk = chunk.astype(casts)
+
+            # Parquet gets unrounded values (same as the in-memory path);
+            # only the CSV text output is trimmed to 4 dp.
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            csv_table = pa.Table.from_pandas(chunk.round(4), preserve_index=False)
+            if csv_writer is None:
+                csv_writer = pacsv.CSVWriter(csv_path, csv_table.schema)
+                pq_writer = pq.ParquetWriter(parquet_path, table.schema, compression="zstd")
+            csv_writer.write_table(csv_table)
+            pq_writer.write_table(table)
+
+            cols = [c for c in NHANES_TO_NAME if c in chunk.columns]
+            if cols:
+                summary_parts.append(chunk[cols])
+            total_rows += len(chunk)
+    finally:
+        if csv_writer is not None:
+            csv_writer.close()
+            pq_writer.close()
+
+    print(f"✅ CSV  saved → {csv_path}  ({csv_path.stat().st_size // 1024:,} KB)")
+    print(f"✅ PARQUET saved → {parquet_path}  ({parquet_path.stat().st_size // 1024:,} KB)")
+    print(f"⚠️  JSON output skipped in --stream mode  ({total_rows:,} rows streamed)")
+
+    return pd.concat(summary_parts) if summary_parts else pd.DataFrame()
+
 
 def show_reference_ranges(df: pd.DataFrame) -> None:
     """
@@ -110,45 +353,71 @@ def show_reference_ranges(df: pd.DataFrame) -> None:
     These can be used as reference ranges in the knowledge graph.
     Maps NHANES variable names → human-readable names.
     """
-    nhanes_to_name = {
-        "LBXWBCSI": "WBC (10^3/mcL)",
-        "LBXRBCSI": "RBC (M/mcL)",
-        "LBXHGB":   "Hemoglobin (g/dL)",
-        "LBXHCT":   "Hematocrit (%)",
-        "LBXMCVSI": "MCV (fL)",
-        "LBXMC":    "MCH (pg)",
-        "LBXMCHSI": "MCHC (g/dL)",
-        "LBXRDW":   "RDW (%)",
-        "LBXPLTSI": "Platelets (10^3/mcL)",
-        "LBXMPSI":  "MPV (fL)",
-        "LBXNRBC":  "NRBC (/100 WBC)",
-    }
-
-    print("\n── Population percentiles (NHANES 2017-2018 survey data) ──────")
-    print(f"{'Test':<28} {'p2.5':>8} {'p25':>8} {'median':>8} {'p75':>8} {'p97.5':>8}")
-    print("─" * 72)
-
-    for var, name in nhanes_to_name.items():
-        if var not in df.columns:
-            continue
-        col = df[var].dropna()
-        if len(col) == 0:
-            continue
-        p = col.quantile([0.025, 0.25, 0.50, 0.75, 0.975])
-        print(
-            f"  {name:<26} "
-            f"{p[0.025]:>8.2f} {p[0.25]:>8.2f} {p[0.50]:>8.2f} "
-            f"{p[0.75]:>8.2f} {p[0.975]:>8.2f}"
+    # Project to the summary columns and compute all percentiles in one
+    # vectorized call (pandas drops NaNs per-column internally) instead of
+    # a separate dropna+quantile pass per column.
+    sub = df[[c for c in NHANES_TO_NAME if c in df.columns]]
+    quantiles = [0.025, 0.25, 0.50, 0.75, 0.975]
+    if _col_quantiles is not None:
+        # One parallel pass over the raw float64 block, all columns at once
+        arr = sub.to_numpy(dtype=np.float64, na_value=np.nan)
+        qs = np.asarray(quantiles)
+        q = pd.DataFrame(_col_quantiles(arr, qs).T, index=quantiles, columns=sub.columns)
+    else:
+        q = sub.quantile(quantiles)
+
+    # Render the whole table at once (pandas' vectorized formatter) and emit
+    # it with a single buffer write instead of a print per column
+    table = q.T.rename(index=NHANES_TO_NAME).dropna(how="all")
+    table.columns = ["p2.5", "p25", "median", "p75", "p97.5"]
+    sys.stdout.flush()
+    sys.stdout.buffer.write(
+        (
+            "\n── Population percentiles (NHANES 2017-2018 survey data) ──────\n"
+            + table.to_string(float_format="%.2f")
+            + "\n\n"
+        ).encode()
+    )
+    sys.stdout.buffer.flush()
+
+
+def _convert_one(filepath: str, out_dir: str, summary: bool, stream: bool = False) -> None:
+    """Convert a single XPT file; unit of work for the process pool."""
+    print(f"\n🔬 Converting: {filepath}")
+
+    if stream:
+        try:
+            import pyarrow  # noqa: F401 — streaming needs the arrow writers
+        except ImportError:
+            print("⚠️  --stream requires pyarrow; falling back to in-memory conversion")
+            stream = False
+
+    if stream:
+        # Parse and write chunk by chunk; only the 11 summary columns are
+        # kept across chunks, so peak memory stays at one chunk.
+        summary_df = save_outputs_streamed(
+            iter_xpt(filepath), out_dir, stem=Path(filepath).stem
         )
-    print()
+        if summary:
+            print("⚠️  Full column summary unavailable in --stream mode")
+        show_reference_ranges(summary_df)
+        return
+
+    df = load_xpt_cached(filepath)
+
+    if summary:
+        print_column_summary(df)
+    show_reference_ranges(df)
+
+    save_outputs(df, out_dir, stem=Path(filepath).stem)
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Convert CBC_J.xpt → CSV + JSON")
+    parser = argparse.ArgumentParser(description="Convert NHANES .xpt files → CSV + JSON + Parquet")
     parser.add_argument(
         "--input",
         default="data/CBC_J.xpt",
-        help="Path to CBC_J.xpt (default: data/CBC_J.xpt)",
+        help="Path or glob of .xpt files (default: data/CBC_J.xpt)",
     )
     parser.add_argument(
         "--out-dir",
@@ -160,18 +429,25 @@ def main():
         action="store_true",
         help="Print column summary and reference range percentiles",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse and write in chunks to bound peak memory (requires pyarrow; skips JSON)",
+    )
     args = parser.parse_args()
 
-    print(f"\n🔬 Converting: {args.input}")
-    df = load_xpt(args.input)
-
-    if args.summary:
-        print_column_summary(df)
-        show_reference_ranges(df)
+    # --input may be a glob (NHANES ships dozens of XPT files per cycle);
+    # files are independent, so convert them in parallel processes.
+    paths = sorted(glob.glob(args.input)) or [args.input]
+    if len(paths) == 1:
+        _convert_one(paths[0], args.out_dir, args.summary, stream=args.stream)
     else:
-        show_reference_ranges(df)
+        worker = partial(
+            _convert_one, out_dir=args.out_dir, summary=args.summary, stream=args.stream
+        )
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            list(ex.map(worker, paths))
 
-    save_outputs(df, args.out_dir)
     print("\n✅ Conversion complete. Files ready in:", args.out_dir)
 
 
@@ -3,28 +3,129 @@
 Create a simple CBC lab report PDF using fpdf2 (compatible with pdf-parse)
 """
 from fpdf import FPDF
+import importlib.util
 import json
 from datetime import datetime
+from pathlib import Path
 
-# Read NHANES data
-with open("../data/CBC_J.json", "r") as f:
-    data = json.load(f)
+import pandas as pd
+
+# Columns the report reads from the NHANES CBC file
+REPORT_COLS = [
+    "SEQN",
+    "LBXHGB", "LBXWBCSI", "LBXPLTSI", "LBXRBCSI",
+    "LBXHCT", "LBXMCVSI", "LBXMC", "LBXMCHSI", "LBXRDW",
+    "LBXNEPCT", "LBXLYPCT", "LBXMOPCT", "LBXEOPCT", "LBXBAPCT",
+    "LBDNENO", "LBDLYMNO",
+]
+
+# Core measures every report must have
+KEY_COLS = ["LBXHGB", "LBXWBCSI", "LBXPLTSI", "LBXRBCSI"]
+
+# Report schema: (NHANES column, test name, unit, reference range,
+# decimal places, default when the value is missing). Keeping this as
+# data rather than hand-coded f-strings means batch rendering (one PDF
+# per patient) only needs to iterate rows, not duplicate formatting code.
+CORE_TESTS = [
+    ("LBXHGB",   "Hemoglobin",                  "g/dL",              "13.5-17.5", 1, None),
+    ("LBXWBCSI", "White Blood Cell Count",      "10^3/mcL",          "4.5-11.0",  1, None),
+    ("LBXPLTSI", "Platelet Count",              "10^3/mcL",          "150-400",   0, None),
+    ("LBXRBCSI", "Red Blood Cell Count",        "million cells/mcL", "4.5-5.9",   2, None),
+    ("LBXHCT",   "Hematocrit",                  "%",                 "38.0-50.0", 1, 42.0),
+    ("LBXMCVSI", "Mean Corpuscular Volume",     "fL",                "80-100",    1, 88.0),
+    ("LBXMC",    "Mean Corpuscular Hemoglobin", "pg",                "27-33",     1, 30.0),
+    ("LBXMCHSI", "MCHC",                        "g/dL",              "32-36",     1, 34.0),
+    ("LBXRDW",   "Red Cell Distribution Width", "%",                 "11.5-14.5", 1, 13.0),
+]
+
+# Differential — included when LBXNEPCT is present
+DIFFERENTIAL_TESTS = [
+    ("LBXNEPCT", "Neutrophils", "%", "40-70", 1, None),
+    ("LBXLYPCT", "Lymphocytes", "%", "20-45", 1, None),
+    ("LBXMOPCT", "Monocytes",   "%", "2-10",  1, 7.0),
+    ("LBXEOPCT", "Eosinophils", "%", "0-6",   1, 2.0),
+    ("LBXBAPCT", "Basophils",   "%", "0-2",   1, 0.5),
+]
+
+# Absolute counts — included when LBDNENO is present
+ABSOLUTE_TESTS = [
+    ("LBDNENO",  "Absolute Neutrophil Count", "10^3/mcL", "1.8-7.0", 1, None),
+    ("LBDLYMNO", "Absolute Lymphocyte Count", "10^3/mcL", "1.0-4.8", 1, None),
+]
 
-# Find a record with complete data
-sample_record = None
-for record in data:
-    if (
-        record.get("LBXHGB")
-        and record.get("LBXWBCSI")
-        and record.get("LBXPLTSI")
-        and record.get("LBXRBCSI")
-    ):
-        sample_record = record
-        break
 
-if not sample_record:
-    print("No complete record found")
-    exit(1)
+ALL_TESTS = CORE_TESTS + DIFFERENTIAL_TESTS + ABSOLUTE_TESTS
+
+# Per-column format strings, built once from the schema so row assembly
+# never re-parses a format spec (and batch mode can format whole columns)
+FMT = {col: f"{{:.{decimals}f}}" for col, _, _, _, decimals, _ in ALL_TESTS}
+
+
+def format_values(record: dict) -> dict:
+    """Format every known measure for one record in a single pass."""
+    formatted = {}
+    for col, _, _, _, _, default in ALL_TESTS:
+        value = record.get(col)
+        if value is None:
+            value = default
+        if value is not None:
+            formatted[col] = FMT[col].format(value)
+    return formatted
+
+
+def build_tests(record: dict) -> list:
+    """Build (name, result, unit, range) rows for one patient record."""
+    schema = list(CORE_TESTS)
+    if record.get("LBXNEPCT"):
+        schema += DIFFERENTIAL_TESTS
+    if record.get("LBDNENO"):
+        schema += ABSOLUTE_TESTS
+    formatted = format_values(record)
+    return [
+        (name, formatted[col], unit, ref_range)
+        for col, name, unit, ref_range, _, _ in schema
+    ]
+
+def load_sample() -> dict:
+    """
+    Load the NHANES data and return the first record with complete core
+    CBC values. Prefers the Parquet sidecar written by convert_xpt.py
+    (columnar binary, only the needed columns are materialized); falls
+    back to the JSON file.
+    """
+    parquet_path = Path("../data/CBC_J.parquet")
+    if parquet_path.exists():
+        # Engine-agnostic read (convert_xpt.py writes the sidecar through
+        # df.to_parquet, so fastparquet-only environments are valid too).
+        # Try the projected read first; both engines raise ValueError-family
+        # errors when a requested column is missing from the file.
+        try:
+            df = pd.read_parquet(parquet_path, columns=REPORT_COLS)
+        except (KeyError, ValueError):
+            df = pd.read_parquet(parquet_path)
+            df = df[[c for c in REPORT_COLS if c in df.columns]]
+    else:
+        # Arrow-backed dtypes keep the values in contiguous native arrays
+        # instead of one PyObject per cell. Probe for pyarrow explicitly —
+        # pandas does not raise a clean ImportError when it is missing.
+        if importlib.util.find_spec("pyarrow") is not None:
+            df = pd.read_json("../data/CBC_J.json", dtype_backend="pyarrow")
+        else:
+            with open("../data/CBC_J.json", "r") as f:
+                df = pd.DataFrame(json.load(f))
+
+    # Find a record with complete data — one vectorized boolean-AND over the
+    # key columns instead of a Python loop with per-record dict lookups
+    mask = df[[c for c in KEY_COLS if c in df.columns]].notna().all(axis=1)
+    if not mask.any():
+        print("No complete record found")
+        raise SystemExit(1)
+
+    # NaN → None so optional fields behave like the original JSON records
+    return {
+        k: (None if pd.isna(v) else v)
+        for k, v in df.loc[mask].iloc[0].to_dict().items()
+    }
 
 
 # Create PDF using fpdf2
@@ -70,125 +171,58 @@ class CBCReport(FPDF):
         )
 
 
-pdf = CBCReport()
-pdf.add_page()
-
-# Patient info section
-pdf.set_font("Arial", "B", 12)
-pdf.cell(0, 8, "LABORATORY REPORT", new_x="LMARGIN", new_y="NEXT")
-pdf.ln(2)
-
-pdf.set_font("Arial", "", 10)
-pdf.cell(
-    0,
-    6,
-    f"Patient ID: SAMPLE-{sample_record.get('SEQN', '12345')}",
-    new_x="LMARGIN",
-    new_y="NEXT",
-)
-pdf.cell(
-    0,
-    6,
-    f"Date of Service: {datetime.now().strftime('%m/%d/%Y')}",
-    new_x="LMARGIN",
-    new_y="NEXT",
-)
-pdf.cell(0, 6, "Ordering Physician: Dr. Jane Smith, MD", new_x="LMARGIN", new_y="NEXT")
-pdf.ln(5)
-
-# CBC Panel heading
-pdf.set_font("Arial", "B", 12)
-pdf.cell(0, 8, "COMPLETE BLOOD COUNT (CBC) PANEL", new_x="LMARGIN", new_y="NEXT")
-pdf.ln(2)
-
-# Column headers
-pdf.set_font("Arial", "B", 9)
-pdf.cell(90, 6, "Test Name", border=0)
-pdf.cell(25, 6, "Result", border=0)
-pdf.cell(35, 6, "Unit", border=0)
-pdf.cell(40, 6, "Reference Range", border=0, new_x="LMARGIN", new_y="NEXT")
-pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-pdf.ln(1)
-
-# Test results
-pdf.set_font("Arial", "", 9)
-
-tests = [
-    ("Hemoglobin", f"{sample_record['LBXHGB']:.1f}", "g/dL", "13.5-17.5"),
-    (
-        "White Blood Cell Count",
-        f"{sample_record['LBXWBCSI']:.1f}",
-        "10^3/mcL",
-        "4.5-11.0",
-    ),
-    ("Platelet Count", f"{sample_record['LBXPLTSI']:.0f}", "10^3/mcL", "150-400"),
-    (
-        "Red Blood Cell Count",
-        f"{sample_record['LBXRBCSI']:.2f}",
-        "million cells/mcL",
-        "4.5-5.9",
-    ),
-    ("Hematocrit", f"{sample_record.get('LBXHCT', 42.0):.1f}", "%", "38.0-50.0"),
-    (
-        "Mean Corpuscular Volume",
-        f"{sample_record.get('LBXMCVSI', 88.0):.1f}",
-        "fL",
-        "80-100",
-    ),
-    (
-        "Mean Corpuscular Hemoglobin",
-        f"{sample_record.get('LBXMC', 30.0):.1f}",
-        "pg",
-        "27-33",
-    ),
-    ("MCHC", f"{sample_record.get('LBXMCHSI', 34.0):.1f}", "g/dL", "32-36"),
-    (
-        "Red Cell Distribution Width",
-        f"{sample_record.get('LBXRDW', 13.0):.1f}",
-        "%",
-        "11.5-14.5",
-    ),
-]
+def build_report(sample_record: dict, output_path: str) -> None:
+    """Render one CBC report PDF for `sample_record` to `output_path`."""
+    pdf = CBCReport()
+    pdf.add_page()
 
-# Add differential if available
-if sample_record.get("LBXNEPCT"):
-    tests.extend(
-        [
-            ("Neutrophils", f"{sample_record['LBXNEPCT']:.1f}", "%", "40-70"),
-            ("Lymphocytes", f"{sample_record['LBXLYPCT']:.1f}", "%", "20-45"),
-            ("Monocytes", f"{sample_record.get('LBXMOPCT', 7.0):.1f}", "%", "2-10"),
-            ("Eosinophils", f"{sample_record.get('LBXEOPCT', 2.0):.1f}", "%", "0-6"),
-            ("Basophils", f"{sample_record.get('LBXBAPCT', 0.5):.1f}", "%", "0-2"),
-        ]
-    )
+    # Patient info section
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "LABORATORY REPORT", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(2)
 
-if sample_record.get("LBDNENO"):
-    tests.extend(
-        [
-            (
-                "Absolute Neutrophil Count",
-                f"{sample_record['LBDNENO']:.1f}",
-                "10^3/mcL",
-                "1.8-7.0",
-            ),
-            (
-                "Absolute Lymphocyte Count",
-                f"{sample_record['LBDLYMNO']:.1f}",
-                "10^3/mcL",
-                "1.0-4.8",
-            ),
-        ]
+    pdf.set_font("Arial", "", 10)
+    pdf.cell(
+        0,
+        6,
+        f"Patient ID: SAMPLE-{sample_record.get('SEQN', '12345')}",
+        new_x="LMARGIN",
+        new_y="NEXT",
     )
+    pdf.cell(
+        0,
+        6,
+        f"Date of Service: {datetime.now().strftime('%m/%d/%Y')}",
+        new_x="LMARGIN",
+        new_y="NEXT",
+    )
+    pdf.cell(0, 6, "Ordering Physician: Dr. Jane Smith, MD", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(5)
+
+    # CBC Panel heading
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "COMPLETE BLOOD COUNT (CBC) PANEL", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(2)
+
+    # Test results — fpdf2's table() lays out header + all rows in one pass
+    # instead of four cell() calls per row (heading row is bold by default)
+    pdf.set_font("Arial", "", 9)
+
+    tests = build_tests(sample_record)
+
+    with pdf.table(
+        col_widths=(90, 25, 35, 40),
+        text_align="LEFT",
+        line_height=5,
+        borders_layout="SINGLE_TOP_LINE",
+    ) as table:
+        table.row(("Test Name", "Result", "Unit", "Reference Range"))
+        for test_row in tests:
+            table.row(test_row)
 
-# Draw each test result
-for test_name, result, unit, ref_range in tests:
-    pdf.cell(90, 5, test_name, border=0)
-    pdf.cell(25, 5, result, border=0)
-    pdf.cell(35, 5, unit, border=0)
-    pdf.cell(40, 5, ref_range, border=0, new_x="LMARGIN", new_y="NEXT")
+    pdf.output(output_path)
+    print(f"✅ Created fpdf2-based CBC report: {output_path}")
 
-# Save PDF
-output_path = "../public/sample_cbc_report.pdf"
-pdf.output(output_path)
 
-print(f"✅ Created fpdf2-based CBC report: {output_path}")
+if __name__ == "__main__":
+    build_report(load_sample(), "../public/sample_cbc_report.pdf")